@@ -4,13 +4,26 @@ Export iCloud Photos album structure from Photos.app database.
 Creates a JSON mapping and optionally copies/symlinks files into album folders.
 """
 
+import ctypes
 import sqlite3
 import json
 import os
+import re
 import sys
+import errno
+import functools
 import shutil
+from collections import namedtuple
+from dataclasses import dataclass
 from pathlib import Path
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Photos library paths
 PHOTOS_LIBRARY = os.path.expanduser("~/Pictures/Photos Library.photoslibrary")
@@ -20,124 +33,239 @@ ORIGINALS_DIR = os.path.join(PHOTOS_LIBRARY, "originals")
 # icloudpd backup location
 ICLOUDPD_BACKUP = os.path.expanduser("~/icloud-photos-backup")
 
+# Characters replaced in album/folder names (\w is Unicode-aware, like str.isalnum)
+_SANITIZE_RE = re.compile(r'[^\w -]')
+
+# Resolves the folder path (ZKIND=4000) of every folder; top-level folders are
+# those whose parent is not itself a titled folder (i.e. the library root)
+_FOLDER_PATH_CTE = """
+        WITH RECURSIVE folder_path(pk, path) AS (
+            SELECT Z_PK, ZTITLE
+            FROM ZGENERICALBUM
+            WHERE ZKIND = 4000 AND ZTITLE IS NOT NULL
+                AND (ZPARENTFOLDER IS NULL OR ZPARENTFOLDER NOT IN (
+                    SELECT Z_PK FROM ZGENERICALBUM WHERE ZKIND = 4000 AND ZTITLE IS NOT NULL
+                ))
+            UNION ALL
+            SELECT f.Z_PK, fp.path || '/' || f.ZTITLE
+            FROM ZGENERICALBUM f
+            JOIN folder_path fp ON f.ZPARENTFOLDER = fp.pk
+            WHERE f.ZKIND = 4000 AND f.ZTITLE IS NOT NULL
+        )
+"""
+
+
+PhotoInfo = namedtuple("PhotoInfo", "filename uuid relative_path original_filename")
+
+
+@dataclass
+class Album:
+    """A user album and the photos it contains."""
+    __slots__ = ("id", "expected_count", "folder", "photos")
+
+    id: int
+    expected_count: int
+    folder: str
+    photos: list
+
+
+@functools.lru_cache(maxsize=None)
+def _sanitize_name(name: str) -> str:
+    """Replace characters other than letters, digits, space, '-' and '_'.
+
+    Cached, since parent folder names repeat across albums.
+
+    Args:
+        name: album or folder name
+
+    Returns:
+        sanitized name
+    """
+    return _SANITIZE_RE.sub('_', name)
+
+
+# copyfile(3) flags from <copyfile.h>
+COPYFILE_ALL = 0xF
+COPYFILE_CLONE = 1 << 24
+
+
+def _load_copyfile():
+    """Load copyfile(3) from libSystem on macOS.
+
+    Returns:
+        copyfile function, or None if unavailable
+    """
+    if sys.platform != "darwin":
+        return None
+    try:
+        copyfile = ctypes.CDLL("/usr/lib/libSystem.dylib", use_errno=True).copyfile
+    except (OSError, AttributeError):
+        return None
+    copyfile.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_void_p, ctypes.c_uint32]
+    copyfile.restype = ctypes.c_int
+    return copyfile
+
+
+_copyfile = _load_copyfile()
+
+
+def _fast_copy(src: str, dst: str) -> None:
+    """Copy a file with metadata, as a copy-on-write clone on APFS when possible.
+
+    Falls back to shutil.copy2, which overwrites dst, if copyfile fails for
+    any reason other than dst already existing.
+
+    Args:
+        src: file to copy (symlinks are followed)
+        dst: destination path
+
+    Raises:
+        FileExistsError: if copyfile reports that dst already exists
+    """
+    if _copyfile is not None:
+        # COPYFILE_CLONE implies COPYFILE_EXCL | COPYFILE_NOFOLLOW_SRC, so resolve
+        # the source ourselves to copy the target rather than the link
+        if _copyfile(os.fsencode(os.path.realpath(src)), os.fsencode(dst), None, COPYFILE_ALL | COPYFILE_CLONE) == 0:
+            return
+        err = ctypes.get_errno()
+        if err == errno.EEXIST:
+            raise FileExistsError(err, os.strerror(err), dst)
+    shutil.copy2(src, dst)
+
+
+def _connect_readonly(db_path: str) -> sqlite3.Connection:
+    """Open a SQLite database read-only, tuned for large read-only JOINs.
+
+    Args:
+        db_path: path to SQLite database
+
+    Returns:
+        open sqlite3 connection
+    """
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    conn.executescript("""
+        PRAGMA cache_size = -65536;
+        PRAGMA mmap_size = 1073741824;
+        PRAGMA temp_store = MEMORY;
+        PRAGMA query_only = 1;
+    """)
+    return conn
+
 
-def _get_albums_with_photos(db_path: str) -> dict:
-    """Extract all user albums and their photo filenames from Photos.sqlite.
+def _get_albums_and_favorites(db_path: str) -> tuple:
+    """Extract all user albums and favorite photos from Photos.sqlite in one query.
 
     Args:
         db_path: path to Photos.sqlite database
 
     Returns:
-        dict mapping album names to album data (id, photos, folder path)
+        tuple of (albums, favorites): dict mapping album names to Album
+        and list of favorite PhotoInfo
     """
-    conn = sqlite3.connect(db_path)
+    conn = _connect_readonly(db_path)
     cursor = conn.cursor()
 
-    # Get folder hierarchy first
-    cursor.execute("""
-        SELECT Z_PK, ZTITLE, ZPARENTFOLDER
-        FROM ZGENERICALBUM
-        WHERE ZKIND = 4000 AND ZTITLE IS NOT NULL
-    """)
-    folders = {row[0]: {"title": row[1], "parent": row[2]} for row in cursor.fetchall()}
-
-    def get_folder_path(album_parent_id):
-        """Build folder path for an album."""
-        path_parts = []
-        current = album_parent_id
-        while current and current in folders:
-            path_parts.insert(0, folders[current]["title"])
-            current = folders[current]["parent"]
-        return "/".join(path_parts) if path_parts else None
-
-    # Get all user-created albums (ZKIND=2) with their photos, including original filename and folder
-    cursor.execute("""
+    # Get all user-created albums (ZKIND=2) with their photos, including original filename.
+    # Assets are joined inside a nested INNER JOIN so empty albums are still returned.
+    # Favorites are appended via UNION ALL with NULL album columns.
+    cursor.execute(_FOLDER_PATH_CTE + """
         SELECT
-            alb.ZTITLE,
+            alb.ZTITLE AS title,
             alb.Z_PK,
             alb.ZCACHEDCOUNT,
-            alb.ZPARENTFOLDER,
+            fp.path,
             asset.ZDIRECTORY,
-            asset.ZFILENAME,
+            asset.ZFILENAME AS filename,
             asset.ZUUID,
             attr.ZORIGINALFILENAME
         FROM ZGENERICALBUM alb
-        LEFT JOIN Z_32ASSETS j ON j.Z_32ALBUMS = alb.Z_PK
-        LEFT JOIN ZASSET asset ON asset.Z_PK = j.Z_3ASSETS
+        LEFT JOIN folder_path fp ON fp.pk = alb.ZPARENTFOLDER
+        LEFT JOIN (
+            Z_32ASSETS j
+            INNER JOIN ZASSET asset ON asset.Z_PK = j.Z_3ASSETS
+        ) ON j.Z_32ALBUMS = alb.Z_PK
+        LEFT JOIN ZADDITIONALASSETATTRIBUTES attr ON attr.ZASSET = asset.Z_PK
+        WHERE alb.ZKIND = 2
+            AND alb.ZTITLE IS NOT NULL
+        UNION ALL
+        SELECT
+            NULL, NULL, NULL, NULL,
+            asset.ZDIRECTORY,
+            asset.ZFILENAME,
+            asset.ZUUID,
+            attr.ZORIGINALFILENAME
+        FROM ZASSET asset
         LEFT JOIN ZADDITIONALASSETATTRIBUTES attr ON attr.ZASSET = asset.Z_PK
-        WHERE alb.ZTITLE IS NOT NULL
-            AND alb.ZKIND = 2
-        ORDER BY alb.ZTITLE, asset.ZFILENAME
+        WHERE asset.ZFAVORITE = 1
+        ORDER BY title, filename
     """)
 
     albums = {}
-    for title, album_pk, cached_count, parent_folder, directory, filename, uuid, original_filename in cursor.fetchall():
-        if title not in albums:
-            folder_path = get_folder_path(parent_folder)
-            albums[title] = {
-                "id": album_pk,
-                "expected_count": cached_count,
-                "folder": folder_path,
-                "photos": []
-            }
+    favorites = []
+    # Iterate the cursor so rows are stepped one at a time instead of materialized
+    for title, album_pk, cached_count, folder_path, directory, filename, uuid, original_filename in cursor:
+        if title is not None and title not in albums:
+            albums[title] = Album(album_pk, cached_count, folder_path, [])
 
         if filename:
-            photo_info = {
-                "filename": filename,
-                "uuid": uuid,
-                "relative_path": f"{directory}/{filename}" if directory else filename,
-                "original_filename": original_filename
-            }
-            albums[title]["photos"].append(photo_info)
+            photo_info = PhotoInfo(
+                filename,
+                uuid,
+                f"{directory}/{filename}" if directory else filename,
+                original_filename
+            )
+            if title is None:
+                favorites.append(photo_info)
+            else:
+                albums[title].photos.append(photo_info)
 
     conn.close()
-    return albums
+    return albums, favorites
 
 
-def _get_favorites(db_path: str) -> list:
-    """Extract all favorite photos from Photos.sqlite.
+def _list_albums(db_path: str) -> tuple:
+    """Count photos per user album and favorites without fetching the photos.
 
     Args:
         db_path: path to Photos.sqlite database
 
     Returns:
-        list of favorite photo dicts (filename, uuid, path, original_filename)
+        tuple of (albums, favorite_count): dict mapping album names to
+        (folder path, photo count) and the number of favorite photos
     """
-    conn = sqlite3.connect(db_path)
+    conn = _connect_readonly(db_path)
     cursor = conn.cursor()
 
-    cursor.execute("""
+    cursor.execute(_FOLDER_PATH_CTE + """
         SELECT
-            asset.ZFILENAME,
-            asset.ZUUID,
-            asset.ZDIRECTORY,
-            attr.ZORIGINALFILENAME
-        FROM ZASSET asset
-        LEFT JOIN ZADDITIONALASSETATTRIBUTES attr ON attr.ZASSET = asset.Z_PK
-        WHERE asset.ZFAVORITE = 1
-        ORDER BY asset.ZFILENAME
+            alb.ZTITLE,
+            fp.path,
+            COUNT(asset.ZFILENAME)
+        FROM ZGENERICALBUM alb
+        LEFT JOIN folder_path fp ON fp.pk = alb.ZPARENTFOLDER
+        LEFT JOIN (
+            Z_32ASSETS j
+            INNER JOIN ZASSET asset ON asset.Z_PK = j.Z_3ASSETS
+        ) ON j.Z_32ALBUMS = alb.Z_PK
+        WHERE alb.ZKIND = 2
+            AND alb.ZTITLE IS NOT NULL
+        GROUP BY alb.ZTITLE
     """)
+    albums = {title: (folder_path, photo_count) for title, folder_path, photo_count in cursor}
 
-    favorites = []
-    for filename, uuid, directory, original_filename in cursor.fetchall():
-        if filename:
-            favorites.append({
-                "filename": filename,
-                "uuid": uuid,
-                "relative_path": f"{directory}/{filename}" if directory else filename,
-                "original_filename": original_filename
-            })
+    cursor.execute("SELECT COUNT(ZFILENAME) FROM ZASSET WHERE ZFAVORITE = 1")
+    favorite_count = cursor.fetchone()[0]
 
     conn.close()
-    return favorites
+    return albums, favorite_count
 
 
 def _export_album_mapping(albums: dict, favorites: list, output_path: str) -> None:
     """Export album structure as JSON.
 
     Args:
-        albums: dict of album data from _get_albums_with_photos
-        favorites: list of favorites from _get_favorites
+        albums: dict of Album from _get_albums_and_favorites
+        favorites: list of favorites from _get_albums_and_favorites
         output_path: path to write JSON file
     """
     export_data = {
@@ -150,8 +278,8 @@ def _export_album_mapping(albums: dict, favorites: list, output_path: str) -> No
             "photo_count": len(favorites),
             "photos": [
                 {
-                    "uuid_filename": p["filename"],
-                    "original_filename": p["original_filename"]
+                    "uuid_filename": p.filename,
+                    "original_filename": p.original_filename
                 }
                 for p in favorites
             ]
@@ -160,20 +288,24 @@ def _export_album_mapping(albums: dict, favorites: list, output_path: str) -> No
 
     for album_name, album_data in albums.items():
         export_data["albums"][album_name] = {
-            "photo_count": len(album_data["photos"]),
-            "expected_count": album_data["expected_count"],
-            "folder": album_data.get("folder"),
+            "photo_count": len(album_data.photos),
+            "expected_count": album_data.expected_count,
+            "folder": album_data.folder,
             "photos": [
                 {
-                    "uuid_filename": p["filename"],
-                    "original_filename": p["original_filename"]
+                    "uuid_filename": p.filename,
+                    "original_filename": p.original_filename
                 }
-                for p in album_data["photos"]
+                for p in album_data.photos
             ]
         }
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(export_data, f, indent=2, ensure_ascii=False)
+    if orjson is not None:
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(export_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(export_data, f, indent=2, ensure_ascii=False)
 
     print(f"Exported album mapping to: {output_path}")
 
@@ -185,85 +317,154 @@ def _build_filename_index(backup_dir: str) -> dict:
         backup_dir: root directory of icloudpd backup
 
     Returns:
-        dict mapping uppercase filenames to full paths
+        dict mapping lowercased filename bytes to full paths
     """
+    def scan(path):
+        """Yield (name, path) for all non-hidden files below path."""
+        try:
+            it = os.scandir(path)
+        except OSError:
+            return
+        with it:
+            for entry in it:
+                # DirEntry caches the dirent type, so no extra stat per file;
+                # like os.walk, symlinked directories are neither indexed nor followed
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        yield from scan(entry.path)
+                elif not entry.name.startswith('.'):
+                    yield entry.name, entry.path
+
+    def index_tree(path):
+        """Index one subtree (case-insensitive, ASCII-only folding in C)."""
+        return {os.fsencode(name).lower(): full_path for name, full_path in scan(path)}
+
     print(f"Building filename index from {backup_dir}...")
     index = {}
-    for root, dirs, files in os.walk(backup_dir):
-        for f in files:
-            if f.startswith('.'):
-                continue
-            full_path = os.path.join(root, f)
-            # Index by filename (case-insensitive)
-            index[f.upper()] = full_path
+    subdirs = []
+    try:
+        with os.scandir(backup_dir) as it:
+            for entry in it:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                elif not entry.name.startswith('.'):
+                    index[os.fsencode(entry.name).lower()] = entry.path
+    except OSError:
+        pass
+
+    # scandir releases the GIL, so top-level subtrees (icloudpd year folders) scan concurrently
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for subtree_index in pool.map(index_tree, subdirs):
+            index.update(subtree_index)
     print(f"  Indexed {len(index)} files")
     return index
 
 
-def _copy_albums_to_folders(albums: dict, favorites: list, output_dir: str, source_dir: str, use_symlinks: bool = True) -> None:
-    """Copy or symlink photos into album folders from icloudpd backup.
+def _copy_albums_to_folders(albums: dict, favorites: list, output_dir: str, source_dir: str, use_symlinks: bool = True, use_hardlinks: bool = False) -> None:
+    """Copy, symlink or hardlink photos into album folders from icloudpd backup.
 
     Args:
-        albums: dict of album data from _get_albums_with_photos
-        favorites: list of favorites from _get_favorites
+        albums: dict of Album from _get_albums_and_favorites
+        favorites: list of favorites from _get_albums_and_favorites
         output_dir: destination directory for album folders
         source_dir: source directory with photos (icloudpd backup)
         use_symlinks: if True, create symlinks; if False, copy files
+        use_hardlinks: if True, create hardlinks when on the same volume as
+            source_dir, falling back to symlinks otherwise
     """
     os.makedirs(output_dir, exist_ok=True)
+    source_dev = None
+    if use_hardlinks:
+        try:
+            source_dev = os.stat(source_dir).st_dev
+        except OSError:
+            # Missing source: nothing will be found, so never hardlink
+            pass
 
     # Build index of files in source directory
     file_index = _build_filename_index(source_dir)
 
+    # Match every distinct original filename against the index once, up front;
+    # photos shared between albums and favorites are then a plain dict hit.
+    # Deduplicating through a set keeps the hashing in C.
+    all_photos = chain.from_iterable(chain((album_data.photos for album_data in albums.values()), (favorites,)))
+    names = {photo.original_filename for photo in all_photos}
+    sources = {fn: file_index.get(os.fsencode(fn).lower()) for fn in names if fn}
+
     total_found = 0
     total_missing = 0
 
-    def sanitize_name(name):
-        return "".join(c if c.isalnum() or c in ' -_' else '_' for c in name)
+    # Copies are bandwidth-bound, links are syscall-latency-bound
+    max_workers = 16 if use_symlinks or use_hardlinks else (os.cpu_count() or 1) * 2
 
     def copy_photos(photos, dest_dir):
-        """Copy or symlink photos to destination directory."""
+        """Copy, symlink or hardlink photos to destination directory."""
         os.makedirs(dest_dir, exist_ok=True)
-        copied = 0
-        for photo in photos:
-            original_filename = photo.get("original_filename")
-            if not original_filename:
-                continue
-
-            src = file_index.get(original_filename.upper())
-            if src:
-                dst = os.path.join(dest_dir, original_filename)
-                if not os.path.exists(dst):
+        hardlink = use_hardlinks and os.stat(dest_dir).st_dev == source_dev
+        # One directory listing instead of a stat per photo on re-runs;
+        # lowercased since APFS is case-insensitive
+        with os.scandir(dest_dir) as it:
+            existing = {entry.name.lower() for entry in it}
+
+        def place(job):
+            """Create a single link or copy; return True if a new file was created."""
+            src, dst = job
+            try:
+                if hardlink:
                     try:
-                        if use_symlinks:
-                            os.symlink(src, dst)
-                        else:
-                            shutil.copy2(src, dst)
-                        copied += 1
-                    except Exception as e:
-                        print(f"    Error: {e}")
-        return copied
+                        os.link(src, dst)
+                    except OSError as e:
+                        if e.errno != errno.EXDEV:
+                            raise
+                        os.symlink(src, dst)
+                elif use_symlinks or use_hardlinks:
+                    os.symlink(src, dst)
+                else:
+                    _fast_copy(src, dst)
+                return True
+            except FileExistsError:
+                return False
+            except Exception as e:
+                print(f"    Error: {e}")
+                return False
+
+        # Resolve (src, dst) pairs up front so the workers only do syscalls;
+        # keying by lowercased filename also drops duplicates within the album,
+        # including case-only ones, keeping the first as before
+        dest_prefix = dest_dir + os.sep
+        jobs = {}
+        for photo in photos:
+            fn = photo.original_filename
+            if fn and sources[fn]:
+                key = fn.lower()
+                if key not in existing and key not in jobs:
+                    jobs[key] = (sources[fn], dest_prefix + fn)
+
+        # Link/copy syscalls release the GIL, so run them concurrently
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return sum(pool.map(place, jobs.values()))
 
     # Export albums with folder hierarchy
     for album_name, album_data in albums.items():
-        if not album_data["photos"]:
+        if not album_data.photos:
             continue
 
         # Build path with folder hierarchy
-        folder_path = album_data.get("folder")
+        folder_path = album_data.folder
         if folder_path:
             # Sanitize each folder part
-            folder_parts = [sanitize_name(p) for p in folder_path.split("/")]
-            album_dir = os.path.join(output_dir, *folder_parts, sanitize_name(album_name))
+            folder_parts = [_sanitize_name(p) for p in folder_path.split("/")]
+            album_dir = os.path.join(output_dir, *folder_parts, _sanitize_name(album_name))
         else:
-            album_dir = os.path.join(output_dir, sanitize_name(album_name))
+            album_dir = os.path.join(output_dir, _sanitize_name(album_name))
 
-        copied = copy_photos(album_data["photos"], album_dir)
+        copied = copy_photos(album_data.photos, album_dir)
         total_found += copied
-        total_missing += len(album_data["photos"]) - copied
+        total_missing += len(album_data.photos) - copied
 
         display_path = f"{folder_path}/{album_name}" if folder_path else album_name
-        print(f"  {display_path}: {copied}/{len(album_data['photos'])} photos")
+        print(f"  {display_path}: {copied}/{len(album_data.photos)} photos")
 
     # Export favorites
     if favorites:
@@ -282,7 +483,9 @@ def main():
     parser.add_argument("--output-json", "-j", help="Output JSON mapping file")
     parser.add_argument("--output-dir", "-d", help="Output directory for album folders")
     parser.add_argument("--source-dir", "-s", default=ICLOUDPD_BACKUP, help="Source directory with photos (icloudpd backup)")
-    parser.add_argument("--copy", action="store_true", help="Copy files instead of symlinking")
+    link_mode = parser.add_mutually_exclusive_group()
+    link_mode.add_argument("--copy", action="store_true", help="Copy files instead of symlinking")
+    link_mode.add_argument("--hardlink", action="store_true", help="Hardlink files instead of symlinking (same volume only, falls back to symlinks)")
     parser.add_argument("--list", "-l", action="store_true", help="Just list albums")
     args = parser.parse_args()
 
@@ -291,15 +494,19 @@ def main():
         sys.exit(1)
 
     print("Reading Photos.app database...")
-    albums = _get_albums_with_photos(PHOTOS_DB)
-    favorites = _get_favorites(PHOTOS_DB)
-
-    print(f"\nFound {len(albums)} albums and {len(favorites)} favorites:")
-    for name, data in sorted(albums.items()):
-        folder = data.get("folder")
+    if args.list:
+        # Counts only; skips fetching the full album x photo rows
+        album_counts, favorite_count = _list_albums(PHOTOS_DB)
+    else:
+        albums, favorites = _get_albums_and_favorites(PHOTOS_DB)
+        album_counts = {name: (data.folder, len(data.photos)) for name, data in albums.items()}
+        favorite_count = len(favorites)
+
+    print(f"\nFound {len(album_counts)} albums and {favorite_count} favorites:")
+    for name, (folder, photo_count) in sorted(album_counts.items()):
         path = f"{folder}/{name}" if folder else name
-        print(f"  {path}: {len(data['photos'])} photos")
-    print(f"  _Favorites: {len(favorites)} photos")
+        print(f"  {path}: {photo_count} photos")
+    print(f"  _Favorites: {favorite_count} photos")
 
     if args.list:
         return
@@ -310,7 +517,7 @@ def main():
     if args.output_dir:
         print(f"\nExporting to folders: {args.output_dir}")
         print(f"Source: {args.source_dir}")
-        _copy_albums_to_folders(albums, favorites, args.output_dir, args.source_dir, use_symlinks=not args.copy)
+        _copy_albums_to_folders(albums, favorites, args.output_dir, args.source_dir, use_symlinks=not args.copy, use_hardlinks=args.hardlink)
 
     if not args.output_json and not args.output_dir:
         print("\nUse --output-json or --output-dir to export")
@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
 
+import ctypes
 import sqlite3
 import shutil
 import os
+import re
 import sys
 from pathlib import Path
 
 VOICE_MEMOS_PATH = os.path.expanduser(
     "~/Library/Group Containers/group.com.apple.VoiceMemos.shared/Recordings"
 )
+_INVALID_CHARS_RE = re.compile(r'[<>:"/\\|?*]')
 
 def _sanitize_filename(name: str) -> str:
     """Remove invalid characters from filename.
@@ -19,10 +22,54 @@ def _sanitize_filename(name: str) -> str:
     Returns:
         sanitized filename
     """
-    invalid_chars = '<>:"/\\|?*'
-    for char in invalid_chars:
-        name = name.replace(char, '_')
-    return name.strip()
+    return _INVALID_CHARS_RE.sub('_', name).strip()
+
+def _load_clonefile():
+    """Load clonefile(2) from libSystem on macOS.
+
+    Returns:
+        clonefile function, or None if unavailable
+    """
+    if sys.platform != "darwin":
+        return None
+    try:
+        clonefile = ctypes.CDLL("/usr/lib/libSystem.dylib", use_errno=True).clonefile
+    except (OSError, AttributeError):
+        return None
+    clonefile.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint32]
+    clonefile.restype = ctypes.c_int
+    return clonefile
+
+_clonefile = _load_clonefile()
+
+def _copy_file(source: str, dest: str) -> None:
+    """Copy file contents, as a copy-on-write clone on APFS when possible.
+
+    Args:
+        source: file to copy
+        dest: destination path (must not exist)
+    """
+    if _clonefile is not None and _clonefile(os.fsencode(source), os.fsencode(dest), 0) == 0:
+        return
+    shutil.copyfile(source, dest)
+
+def _connect_readonly(db_path: str) -> sqlite3.Connection:
+    """Open a SQLite database read-only, tuned for read-only queries.
+
+    Args:
+        db_path: path to SQLite database
+
+    Returns:
+        open sqlite3 connection
+    """
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    conn.executescript("""
+        PRAGMA cache_size = -65536;
+        PRAGMA mmap_size = 1073741824;
+        PRAGMA temp_store = MEMORY;
+        PRAGMA query_only = 1;
+    """)
+    return conn
 
 def extract_voice_memos(output_dir: str) -> None:
     """Extract Voice Memos from local iCloud sync to output directory.
@@ -40,7 +87,7 @@ def extract_voice_memos(output_dir: str) -> None:
             f"CloudRecordings.db not found at {db_path}. Make sure Voice Memos iCloud sync is enabled."
         )
 
-    conn = sqlite3.connect(db_path)
+    conn = _connect_readonly(db_path)
     cursor = conn.cursor()
 
     # Get folders
@@ -60,9 +107,14 @@ def extract_voice_memos(output_dir: str) -> None:
     rows = cursor.fetchall()
     print(f"Found {len(rows)} Voice Memos")
 
+    # Names already taken per destination directory, lowercased since APFS is
+    # case-insensitive; filled from disk on first use of each directory
+    used_names = {}
+
+    source_prefix = VOICE_MEMOS_PATH + os.sep
     extracted = 0
     for path, label, zdate, folder_id in rows:
-        source = os.path.join(VOICE_MEMOS_PATH, path)
+        source = source_prefix + path
 
         if os.path.exists(source):
             # Use label if available
@@ -79,21 +131,29 @@ def extract_voice_memos(output_dir: str) -> None:
             else:
                 dest_dir = output_dir
 
-            dest = os.path.join(dest_dir, filename)
+            used = used_names.get(dest_dir)
+            if used is None:
+                with os.scandir(dest_dir) as it:
+                    used = used_names[dest_dir] = {entry.name.lower() for entry in it}
 
             # Handle duplicates
             counter = 1
-            base, ext = os.path.splitext(dest)
-            while os.path.exists(dest):
-                dest = f"{base}_{counter}{ext}"
+            base, ext = os.path.splitext(filename)
+            while filename.lower() in used:
+                filename = f"{base}_{counter}{ext}"
                 counter += 1
+            used.add(filename.lower())
 
-            shutil.copy2(source, dest)
+            dest = dest_dir + os.sep + filename
+
+            _copy_file(source, dest)
 
             # Set file modification time from database
             if zdate:
                 unix_timestamp = zdate + 978307200
                 os.utime(dest, (unix_timestamp, unix_timestamp))
+            else:
+                shutil.copystat(source, dest)
 
             print(f"Extracted: {os.path.basename(dest)}")
             extracted += 1